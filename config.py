@@ -0,0 +1,42 @@
+"""
+設定モジュール
+環境変数（.env）から設定を読み込み、プロセス内で共有する
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Config:
+    """システム設定"""
+    
+    spreadsheet_id: Optional[str]
+    tesseract_path: Optional[str]
+    ocr_lang: str
+    ocr_config: str
+    input_folder: str
+    output_folder: str
+    processed_folder: str
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """設定を取得（環境変数の読み込みは初回呼び出し時のみ）
+    
+    Returns:
+        設定
+    """
+    load_dotenv()
+    
+    return Config(
+        spreadsheet_id=os.getenv('GOOGLE_SHEETS_ID'),
+        tesseract_path=os.getenv('TESSERACT_PATH'),
+        ocr_lang=os.getenv('OCR_LANG', 'jpn+eng'),
+        ocr_config=os.getenv('OCR_CONFIG', '--psm 6'),
+        input_folder=os.getenv('INPUT_FOLDER', './input'),
+        output_folder=os.getenv('OUTPUT_FOLDER', './output'),
+        processed_folder=os.getenv('PROCESSED_FOLDER', './processed'),
+    )
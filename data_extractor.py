@@ -4,7 +4,8 @@ OCRで抽出されたテキストから注文情報を構造化して抽出す
 """
 import re
 from datetime import datetime
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +31,41 @@ class OrderDataExtractor:
         
         # 単価パターン
         self.unit_price_pattern = r'単価[：:\s]*([\d,]+)'
+        
+        # 得意先名キーワード（優先順）
+        self.customer_keywords = ('得意先', 'お客様', '宛先', '御中')
+        
+        # コンパイル済みパターン（呼び出しごとの再コンパイルを避ける）
+        # 日付パターンは先読みでまとめ、重なった候補も含めてテキストを1回だけ走査する
+        self._date_re = re.compile(
+            '(?=' + '|'.join(f'(?:{p})' for p in self.date_patterns) + ')'
+        )
+        # グループ番号（1始まり）から、何番目の日付パターンに一致したかを引く表
+        self._date_pattern_by_group = [
+            index for index, p in enumerate(self.date_patterns)
+            for _ in range(re.compile(p).groups)
+        ]
+        # 数量・単価・金額を1つの選択パターンにまとめ、1行を1回だけ走査する
+        self._items_re = re.compile('|'.join(
+            f'(?P<{field}>{pattern})' for field, pattern in (
+                ('qty', self.quantity_pattern),
+                ('price', self.unit_price_pattern),
+                ('amount', self.amount_pattern),
+            )
+        ))
+        # 数量・単価の値は各パターンの最初のグループ（名前付きグループの直後の番号）
+        self._qty_value_group = self._items_re.groupindex['qty'] + 1
+        self._price_value_group = self._items_re.groupindex['price'] + 1
+        # 得意先名キーワードは先読みでまとめ、重なった候補も1回の走査で拾う
+        self._customer_re = re.compile(
+            r'(?=(?P<keyword>' + '|'.join(self.customer_keywords) + r')'
+            r'[：:\s]*(?P<name>[^\n]+))'
+        )
+        # 敬称除去用の変換テーブル（正規表現を使わずに削除する）
+        self._honorific_table = str.maketrans('', '', '様御中')
+        
+        # 同じテキストを再処理した場合は抽出結果を再利用する
+        self._parse_text_cached = lru_cache(maxsize=128)(self._parse_text)
     
     def extract_date(self, text: str) -> Optional[str]:
         """日付を抽出
@@ -40,72 +76,117 @@ class OrderDataExtractor:
         Returns:
             日付文字列（YYYY-MM-DD形式）、見つからない場合はNone
         """
-        for pattern in self.date_patterns:
-            match = re.search(pattern, text)
-            if match:
-                year, month, day = match.groups()
-                
-                # 和暦の場合は西暦に変換（簡易版）
-                if len(year) == 2:
-                    year_int = int(year)
-                    if year_int >= 0 and year_int <= 99:
-                        # 平成/令和変換の簡易版（必要に応じて調整）
-                        if year_int <= 30:  # 平成の想定
-                            year = str(2000 + year_int)
-                        else:
-                            year = str(1900 + year_int)
-                
-                # 日付の正規化
-                try:
-                    date_obj = datetime(int(year), int(month), int(day))
-                    return date_obj.strftime('%Y-%m-%d')
-                except ValueError:
-                    continue
+        # パターンごとに最初の有効な日付を集め、date_patternsの優先順に返す
+        found = {}
+        for match in self._date_re.finditer(text):
+            index = self._date_pattern_by_group[match.lastindex - 1]
+            if index in found:
+                continue
+            
+            # マッチしたパターンのグループ（年・月・日）だけを取り出す
+            year, month, day = [g for g in match.groups() if g is not None]
+            date = self._normalize_date(year, month, day)
+            if date:
+                if index == 0:
+                    # 最優先のパターンが見つかれば残りの走査は不要
+                    return date
+                found[index] = date
+        
+        for index in range(len(self.date_patterns)):
+            if index in found:
+                return found[index]
         
         return None
     
-    def extract_customer_name(self, text: str) -> Optional[str]:
+    def _normalize_date(self, year: str, month: str, day: str) -> Optional[str]:
+        """年・月・日の文字列をYYYY-MM-DD形式に正規化
+        
+        Args:
+            year: 年（2桁の場合は西暦に変換）
+            month: 月
+            day: 日
+            
+        Returns:
+            日付文字列（YYYY-MM-DD形式）、存在しない日付の場合はNone
+        """
+        # 和暦の場合は西暦に変換（簡易版）
+        if len(year) == 2:
+            year_int = int(year)
+            if year_int >= 0 and year_int <= 99:
+                # 平成/令和変換の簡易版（必要に応じて調整）
+                if year_int <= 30:  # 平成の想定
+                    year = str(2000 + year_int)
+                else:
+                    year = str(1900 + year_int)
+        
+        # 日付の正規化
+        try:
+            date_obj = datetime(int(year), int(month), int(day))
+            return date_obj.strftime('%Y-%m-%d')
+        except ValueError:
+            return None
+    
+    def extract_customer_name(self, text: str,
+                              lines: Optional[List[str]] = None) -> Optional[str]:
         """得意先名を抽出
         
         Args:
             text: テキスト
+            lines: 行分割済みのテキスト（省略時はtextから分割）
             
         Returns:
             得意先名、見つからない場合はNone
         """
         # 注文書によくあるキーワードの後から抽出
-        patterns = [
-            r'得意先[：:\s]*([^\n]+)',
-            r'お客様[：:\s]*([^\n]+)',
-            r'宛先[：:\s]*([^\n]+)',
-            r'御中[：:\s]*([^\n]+)',
-        ]
+        # キーワードごとに最初の候補を集め、優先順に評価する
+        candidates = {}
+        for match in self._customer_re.finditer(text):
+            keyword = match.group('keyword')
+            if keyword not in candidates:
+                candidates[keyword] = match.group('name')
+                if len(candidates) == len(self.customer_keywords):
+                    break
         
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                name = match.group(1).strip()
+        for keyword in self.customer_keywords:
+            if keyword in candidates:
+                name = candidates[keyword].strip()
                 # 不要な文字を除去
-                name = re.sub(r'[様御中]', '', name).strip()
+                name = name.translate(self._honorific_table).strip()
                 if name:
                     return name
         
         # 最初の数行から抽出（フォールバック）
-        lines = text.split('\n')[:5]
-        for line in lines:
+        if lines is None:
+            lines = text.split('\n', 5)
+        for line in lines[:5]:
             line = line.strip()
-            if line and len(line) > 2 and len(line) < 50:
+            if 2 < len(line) < 50:
                 # 会社名っぽい行を抽出
-                if not re.match(r'^[\d\s,]+$', line):  # 数字のみではない
+                if not self._is_numeric_only(line):
                     return line
         
         return None
     
-    def extract_items(self, text: str) -> List[Dict[str, Optional[str]]]:
+    def _is_numeric_only(self, line: str) -> bool:
+        """数字・空白・カンマのみの行かを判定（正規表現 ^[\\d\\s,]+$ と同じ判定）
+        
+        Args:
+            line: 行
+            
+        Returns:
+            数字・空白・カンマのみの場合True
+        """
+        # split()とisdecimal()は正規表現の\s・\dと同じUnicodeの空白・数字を対象にする
+        digits = ''.join(line.replace(',', ' ').split())
+        return not digits or digits.isdecimal()
+    
+    def extract_items(self, text: str,
+                      lines: Optional[List[str]] = None) -> List[Dict[str, Optional[str]]]:
         """商品情報を抽出
         
         Args:
             text: テキスト
+            lines: 行分割済みのテキスト（省略時はtextから分割）
             
         Returns:
             商品情報のリスト（品名、数量、単価、金額を含む）
@@ -115,7 +196,8 @@ class OrderDataExtractor:
         # テーブル形式のデータを抽出（簡易版）
         # 実際の注文書フォーマットに合わせて調整が必要
         
-        lines = text.split('\n')
+        if lines is None:
+            lines = text.split('\n')
         current_item = {}
         
         for line in lines:
@@ -123,26 +205,29 @@ class OrderDataExtractor:
             if not line:
                 continue
             
-            # 数量を探す
-            qty_match = re.search(self.quantity_pattern, line)
-            if qty_match:
-                current_item['quantity'] = qty_match.group(1).replace(',', '')
-            
-            # 単価を探す
-            price_match = re.search(self.unit_price_pattern, line)
-            if price_match:
-                current_item['unit_price'] = price_match.group(1).replace(',', '')
-            
-            # 金額を探す
-            amount_matches = re.findall(self.amount_pattern, line)
-            if amount_matches and 'amount' not in current_item:
-                # 最初に見つかった金額を使用
-                amount = amount_matches[0].replace(',', '').replace('円', '')
-                current_item['amount'] = amount
+            # 数量・単価・金額を1回の走査で探す（各項目とも行内で最初の一致のみ使う）
+            found_fields = set()
+            for match in self._items_re.finditer(line):
+                field = match.lastgroup
+                if field in found_fields:
+                    continue
+                found_fields.add(field)
+                
+                if field == 'qty':
+                    qty = match.group(self._qty_value_group)
+                    current_item['quantity'] = qty.replace(',', '')
+                elif field == 'price':
+                    price = match.group(self._price_value_group)
+                    current_item['unit_price'] = price.replace(',', '')
+                elif 'amount' not in current_item:
+                    # 最初に見つかった金額を使用
+                    amount = match.group('amount').replace(',', '').replace('円', '')
+                    current_item['amount'] = amount
             
             # 品名っぽい行を探す（数字のみではない、ある程度の長さがある）
-            if not re.match(r'^[\d\s,円]+$', line) and len(line) > 2:
-                if 'product_name' not in current_item:
+            # 品名が決まった後は判定用の文字列を作らない
+            if 'product_name' not in current_item and len(line) > 2:
+                if not self._is_numeric_only(line.replace('円', ' ')):
                     current_item['product_name'] = line
         
         # 最後のアイテムを追加
@@ -151,26 +236,45 @@ class OrderDataExtractor:
         
         return items
     
-    def extract_order_data(self, text: str, filename: str = '') -> Dict:
-        """注文書データを抽出
+    def _parse_text(self, text: str) -> Tuple[Optional[str], Optional[str],
+                                               List[Dict[str, Optional[str]]]]:
+        """テキストから日付・得意先名・商品情報を抽出
         
         Args:
             text: OCRで抽出されたテキスト
-            filename: 元ファイル名
             
         Returns:
-            注文データの辞書
+            (日付, 得意先名, 商品情報のリスト)
         """
-        logger.info(f"データ抽出開始: {filename}")
+        # 行分割は1回だけ行い、各抽出処理で共有する
+        lines = text.split('\n')
         
         # 日付抽出
         date = self.extract_date(text)
         
         # 得意先名抽出
-        customer = self.extract_customer_name(text)
+        customer = self.extract_customer_name(text, lines)
         
         # 商品情報抽出
-        items = self.extract_items(text)
+        items = self.extract_items(text, lines)
+        
+        return date, customer, items
+    
+    def extract_order_data(self, text: str, filename: str = '') -> Dict:
+        """注文書データを抽出
+        
+        Args:
+            text: OCRで抽出されたテキスト
+            filename: 元ファイル名
+            
+        Returns:
+            注文データの辞書
+        """
+        logger.info(f"データ抽出開始: {filename}")
+        
+        # 同じテキストの再処理（リトライ等）ではキャッシュ済みの結果を使う
+        date, customer, cached_items = self._parse_text_cached(text)
+        items = [dict(item) for item in cached_items]
         
         # 結果をまとめる
         result = {
@@ -3,7 +3,7 @@ Googleスプレッドシート連携モジュール
 データをGoogleスプレッドシートに自動投入する
 """
 import os
-from typing import List
+from typing import Dict, List
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -30,6 +30,8 @@ class GoogleSheetsClient:
         self.spreadsheet_id = spreadsheet_id
         self.credentials_path = credentials_path
         self.service = None
+        # シート名ごとのヘッダー行キャッシュ（確認のためのAPI呼び出しを1回に抑える）
+        self._header_cache: Dict[str, List[str]] = {}
         self._authenticate()
     
     def _authenticate(self):
@@ -96,6 +98,9 @@ class GoogleSheetsClient:
         Returns:
             ヘッダー行のリスト
         """
+        if sheet_name in self._header_cache:
+            return list(self._header_cache[sheet_name])
+        
         try:
             result = self.service.spreadsheets().values().get(
                 spreadsheetId=self.spreadsheet_id,
@@ -103,9 +108,9 @@ class GoogleSheetsClient:
             ).execute()
             
             values = result.get('values', [])
-            if values:
-                return values[0]
-            return []
+            headers = values[0] if values else []
+            self._header_cache[sheet_name] = headers
+            return list(headers)
         except HttpError as error:
             logger.error(f"ヘッダー取得エラー: {error}")
             return []
@@ -129,6 +134,7 @@ class GoogleSheetsClient:
                 valueInputOption='USER_ENTERED',
                 body={'values': [expected_headers]}
             ).execute()
+            self._header_cache[sheet_name] = expected_headers
             logger.info(f"ヘッダー行を作成しました: {sheet_name}")
 
 
@@ -4,11 +4,14 @@ FAX注文書自動処理システム メインスクリプト
 import os
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from dotenv import load_dotenv
+from typing import Dict, Iterable, List, Optional, Tuple
 import logging
 
-from ocr_processor import OCRProcessor
+from config import get_config
+from ocr_processor import OCRProcessor, limit_tesseract_threads
 from data_extractor import OrderDataExtractor
 from google_sheets import GoogleSheetsClient
 
@@ -18,24 +21,59 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 環境変数を読み込み
-load_dotenv()
+# 入力フォルダから処理対象とするファイルの拡張子
+SUPPORTED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg'}
 
+# スプレッドシートへまとめて追加する行数の目安
+SHEETS_BATCH_ROWS = 500
 
-def process_file(file_path: str, ocr_processor: OCRProcessor, 
-                 extractor: OrderDataExtractor, sheets_client: GoogleSheetsClient,
-                 manual_review: bool = False) -> bool:
-    """1つのファイルを処理
+
+@lru_cache(maxsize=None)
+def get_ocr_processor(max_workers: Optional[int] = None) -> OCRProcessor:
+    """OCR処理インスタンスを取得（同じ並列数ならプロセス内で再利用）
+    
+    Args:
+        max_workers: PDFページを並列処理する最大数
+        
+    Returns:
+        OCR処理インスタンス
+    """
+    config = get_config()
+    return OCRProcessor(config.tesseract_path, config.ocr_lang, max_workers=max_workers,
+                        tesseract_config=config.ocr_config)
+
+
+@lru_cache(maxsize=1)
+def get_extractor() -> OrderDataExtractor:
+    """データ抽出インスタンスを取得（プロセス内で再利用）
+    
+    Returns:
+        データ抽出インスタンス
+    """
+    return OrderDataExtractor()
+
+
+@lru_cache(maxsize=1)
+def get_sheets_client() -> GoogleSheetsClient:
+    """Google Sheetsクライアントを取得（認証はプロセス内で1回のみ）
+    
+    Returns:
+        Google Sheetsクライアント
+    """
+    return GoogleSheetsClient(get_config().spreadsheet_id)
+
+
+def extract_file(file_path: str, ocr_processor: OCRProcessor,
+                 extractor: OrderDataExtractor) -> Optional[Dict]:
+    """1つのファイルからOCRで注文データを抽出
     
     Args:
         file_path: 処理するファイルのパス
         ocr_processor: OCR処理インスタンス
         extractor: データ抽出インスタンス
-        sheets_client: Google Sheetsクライアント
-        manual_review: 手動確認モード
         
     Returns:
-        処理成功したらTrue
+        注文データの辞書、抽出できなかった場合はNone
     """
     try:
         logger.info(f"処理開始: {file_path}")
@@ -45,16 +83,34 @@ def process_file(file_path: str, ocr_processor: OCRProcessor,
         
         if not text.strip():
             logger.warning(f"テキストが抽出できませんでした: {file_path}")
-            return False
+            return None
         
         # データ抽出
         filename = os.path.basename(file_path)
-        order_data = extractor.extract_order_data(text, filename)
+        return extractor.extract_order_data(text, filename)
         
+    except Exception as e:
+        logger.error(f"処理エラー {file_path}: {e}", exc_info=True)
+        return None
+
+
+def prepare_rows(order_data: Dict, extractor: OrderDataExtractor,
+                 manual_review: bool = False) -> Optional[List[List[str]]]:
+    """抽出した注文データをスプレッドシートの行データに変換
+    
+    Args:
+        order_data: 抽出された注文データ
+        extractor: データ抽出インスタンス
+        manual_review: 手動確認モード
+        
+    Returns:
+        スプレッドシートの行データのリスト、キャンセル・エラーの場合はNone
+    """
+    try:
         # 手動確認モード
         if manual_review:
             print("\n" + "="*50)
-            print(f"ファイル: {filename}")
+            print(f"ファイル: {order_data.get('filename', '')}")
             print(f"日付: {order_data.get('date', 'N/A')}")
             print(f"得意先: {order_data.get('customer_name', 'N/A')}")
             print(f"商品数: {len(order_data.get('items', []))}")
@@ -65,20 +121,109 @@ def process_file(file_path: str, ocr_processor: OCRProcessor,
             response = input("\nこのデータをスプレッドシートに追加しますか？ (y/n): ")
             if response.lower() != 'y':
                 logger.info("ユーザーがキャンセルしました")
-                return False
+                return None
         
         # スプレッドシート用にフォーマット
-        rows = extractor.format_for_sheets(order_data)
+        return extractor.format_for_sheets(order_data)
         
-        # スプレッドシートに追加
-        sheets_client.append_rows('Sheet1', rows)
+    except Exception as e:
+        logger.error(f"処理エラー {order_data.get('filename', '')}: {e}", exc_info=True)
+        return None
+
+
+def flush_rows(pending: List[Tuple[Path, List[List[str]]]],
+               sheets_client: GoogleSheetsClient, processed_folder: str) -> int:
+    """保留中の行をまとめてスプレッドシートに追加し、追加できたファイルを移動
+    
+    一括追加に失敗した場合は、原因のファイルを特定できるようファイルごとに追加し直す
+    
+    Args:
+        pending: (ファイルパス, 行データのリスト)のリスト（処理後に空になる）
+        sheets_client: Google Sheetsクライアント
+        processed_folder: 処理済みフォルダのパス
         
+    Returns:
+        スプレッドシートに追加できたファイル数
+    """
+    if not pending:
+        return 0
+    
+    try:
+        all_rows = [row for _, rows in pending for row in rows]
+        sheets_client.append_rows('Sheet1', all_rows)
+        succeeded = [file_path for file_path, _ in pending]
+    except Exception as e:
+        logger.warning(f"一括追加エラー、ファイルごとに追加し直します: {e}")
+        succeeded = []
+        for file_path, rows in pending:
+            try:
+                sheets_client.append_rows('Sheet1', rows)
+                succeeded.append(file_path)
+            except Exception as e:
+                logger.error(f"処理エラー {file_path}: {e}", exc_info=True)
+    
+    for file_path in succeeded:
         logger.info(f"処理完了: {file_path}")
-        return True
+        move_to_processed(file_path, processed_folder)
+    
+    pending.clear()
+    return len(succeeded)
+
+
+def save_orders(files_to_process: List[Path], results: Iterable[Optional[Dict]],
+                extractor: OrderDataExtractor, sheets_client: GoogleSheetsClient,
+                processed_folder: str, manual_review: bool = False) -> int:
+    """抽出結果を順番に受け取り、スプレッドシートにまとめて追加
+    
+    Args:
+        files_to_process: 処理するファイルのリスト
+        results: 各ファイルの抽出結果（files_to_processと同じ順番）
+        extractor: データ抽出インスタンス
+        sheets_client: Google Sheetsクライアント
+        processed_folder: 処理済みフォルダのパス
+        manual_review: 手動確認モード
+        
+    Returns:
+        処理成功したファイル数
+    """
+    success_count = 0
+    pending = []
+    pending_row_count = 0
+    
+    for file_path, order_data in zip(files_to_process, results):
+        if order_data is None:
+            continue
+        
+        rows = prepare_rows(order_data, extractor, manual_review)
+        if rows is None:
+            continue
         
+        pending.append((file_path, rows))
+        pending_row_count += len(rows)
+        
+        # 一定行数たまったらまとめて追加
+        # 手動確認モードでは、承認したデータが中断時に失われないよう1ファイルごとに追加する
+        if manual_review or pending_row_count >= SHEETS_BATCH_ROWS:
+            success_count += flush_rows(pending, sheets_client, processed_folder)
+            pending_row_count = 0
+    
+    success_count += flush_rows(pending, sheets_client, processed_folder)
+    return success_count
+
+
+def move_to_processed(file_path: Path, processed_folder: str):
+    """処理済みフォルダにファイルを移動
+    
+    Args:
+        file_path: 移動するファイルのパス
+        processed_folder: 処理済みフォルダのパス
+    """
+    try:
+        processed_path = Path(processed_folder) / file_path.name
+        file_path.rename(processed_path)
+        logger.info(f"処理済みフォルダに移動: {file_path.name}")
     except Exception as e:
-        logger.error(f"処理エラー {file_path}: {e}", exc_info=True)
-        return False
+        logger.warning(f"ファイル移動エラー: {e}")
 
 
 def main():
@@ -87,14 +232,15 @@ def main():
     parser.add_argument('--batch', action='store_true', help='バッチ処理モード')
     parser.add_argument('--manual-review', action='store_true', help='手動確認モード')
     parser.add_argument('--file', type=str, help='処理する単一ファイルのパス')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='バッチ処理で並列にOCRするファイル数（デフォルト: CPUコア数）')
     args = parser.parse_args()
     
-    # 環境変数の取得
-    spreadsheet_id = os.getenv('GOOGLE_SHEETS_ID')
-    tesseract_path = os.getenv('TESSERACT_PATH')
-    input_folder = os.getenv('INPUT_FOLDER', './input')
-    processed_folder = os.getenv('PROCESSED_FOLDER', './processed')
-    ocr_lang = os.getenv('OCR_LANG', 'jpn+eng')
+    # 設定の取得
+    config = get_config()
+    spreadsheet_id = config.spreadsheet_id
+    input_folder = config.input_folder
+    processed_folder = config.processed_folder
     
     # 必須設定のチェック
     if not spreadsheet_id:
@@ -105,10 +251,20 @@ def main():
     os.makedirs(input_folder, exist_ok=True)
     os.makedirs(processed_folder, exist_ok=True)
     
-    # インスタンスの作成
-    ocr_processor = OCRProcessor(tesseract_path, ocr_lang)
-    extractor = OrderDataExtractor()
-    sheets_client = GoogleSheetsClient(spreadsheet_id)
+    # 手動確認モード以外では、OCR・データ抽出とスプレッドシートへの追加を重ねて実行する
+    # バッチ処理モードではファイル単位でも並列化するため、ページ単位の並列数を抑える
+    pipelined = not args.manual_review
+    cpu_count = os.cpu_count() or 1
+    file_workers = max(1, args.workers or cpu_count) if args.batch else 1
+    page_workers = max(1, cpu_count // file_workers) if pipelined else None
+    if pipelined and file_workers > 1:
+        # 複数ファイルのtesseractを同時に動かすため、内部スレッド数を制限する
+        limit_tesseract_threads()
+    
+    # インスタンスの取得（同じプロセス内で再度実行された場合は再利用）
+    ocr_processor = get_ocr_processor(page_workers)
+    extractor = get_extractor()
+    sheets_client = get_sheets_client()
     
     # ヘッダー行の確認・作成
     sheets_client.create_header_if_needed('Sheet1')
@@ -119,17 +275,17 @@ def main():
     if args.file:
         # 単一ファイル指定
         if os.path.exists(args.file):
-            files_to_process = [args.file]
+            files_to_process = [Path(args.file)]
         else:
             logger.error(f"ファイルが見つかりません: {args.file}")
             sys.exit(1)
     else:
-        # 入力フォルダから取得
+        # 入力フォルダから取得（フォルダの走査は1回だけ、拡張子の大文字小文字は区別しない）
         input_path = Path(input_folder)
-        files_to_process = list(input_path.glob('*.pdf')) + \
-                          list(input_path.glob('*.png')) + \
-                          list(input_path.glob('*.jpg')) + \
-                          list(input_path.glob('*.jpeg'))
+        files_to_process = sorted(
+            p for p in input_path.iterdir()
+            if p.suffix.lower() in SUPPORTED_EXTENSIONS and p.is_file()
+        )
         
         if not files_to_process:
             logger.info(f"処理するファイルが見つかりません: {input_folder}")
@@ -138,21 +294,23 @@ def main():
     logger.info(f"{len(files_to_process)}個のファイルを処理します")
     
     # ファイル処理
-    success_count = 0
-    for file_path in files_to_process:
-        file_path_str = str(file_path)
-        
-        if process_file(file_path_str, ocr_processor, extractor, sheets_client, 
-                       args.manual_review):
-            success_count += 1
-            
-            # 処理済みフォルダに移動
-            try:
-                processed_path = Path(processed_folder) / file_path.name
-                file_path.rename(processed_path)
-                logger.info(f"処理済みフォルダに移動: {file_path.name}")
-            except Exception as e:
-                logger.warning(f"ファイル移動エラー: {e}")
+    if pipelined:
+        # OCR・データ抽出はワーカースレッドで先行して実行し、
+        # メインスレッドが結果を順番に受け取ってスプレッドシートに追加する
+        # （追加の通信中も次のファイルのOCRが進む。Google APIクライアントは
+        #   スレッドセーフではないため、追加はメインスレッドのみで行う）
+        with ThreadPoolExecutor(max_workers=file_workers) as executor:
+            results = executor.map(
+                lambda p: extract_file(str(p), ocr_processor, extractor),
+                files_to_process
+            )
+            success_count = save_orders(files_to_process, results, extractor,
+                                        sheets_client, processed_folder)
+    else:
+        results = (extract_file(str(p), ocr_processor, extractor)
+                   for p in files_to_process)
+        success_count = save_orders(files_to_process, results, extractor,
+                                    sheets_client, processed_folder, args.manual_review)
     
     logger.info(f"処理完了: {success_count}/{len(files_to_process)}個のファイルが成功しました")
 
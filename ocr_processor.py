@@ -3,28 +3,137 @@ OCR処理モジュール
 PDF/画像ファイルからテキストを抽出する
 """
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 import pytesseract
 from PIL import Image
 from pdf2image import convert_from_path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def limit_tesseract_threads():
+    """Tesseract内部のOpenMPスレッド数を1に制限
+    
+    複数のtesseractプロセスを同時に実行すると、各プロセスのOpenMPスレッドで
+    CPUが過剰に割り当てられ、逐次実行より遅くなることがあるため
+    （環境変数OMP_THREAD_LIMITが設定済みの場合はその値を優先）
+    """
+    os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+
+# 前処理（グレースケール化・二値化）を行う画像モード
+_BINARIZE_MODES = ('L', 'LA', 'P', 'RGB', 'RGBA', 'CMYK')
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """大津の二値化で閾値を求める
+    
+    Args:
+        histogram: グレースケール画像の輝度ヒストグラム（256階調）
+        
+    Returns:
+        閾値（この値以下の画素を黒とする）
+    """
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    
+    sum_bg = 0
+    weight_bg = 0
+    best_threshold = 0
+    best_variance = 0.0
+    for threshold, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        
+        sum_bg += threshold * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        # クラス間分散が最大になる閾値を採用
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_variance = variance
+            best_threshold = threshold
+    
+    return best_threshold
+
+
 class OCRProcessor:
     """OCR処理を行うクラス"""
     
-    def __init__(self, tesseract_path: Optional[str] = None, lang: str = 'jpn+eng'):
+    def __init__(self, tesseract_path: Optional[str] = None, lang: str = 'jpn+eng',
+                 max_workers: Optional[int] = None, dpi: int = 300, fast_dpi: int = 200,
+                 confidence_threshold: float = 80.0, tesseract_config: str = '--psm 6'):
         """
         Args:
             tesseract_path: Tesseract OCRの実行ファイルパス
             lang: OCR言語設定（デフォルト: jpn+eng）
+            max_workers: PDFページを並列処理する最大数（デフォルト: CPUコア数）
+            dpi: PDFを画像に変換する解像度（デフォルト: 300）
+            fast_dpi: 先に試す低解像度（デフォルト: 200）
+            confidence_threshold: 低解像度を採用するOCR平均信頼度（デフォルト: 80）
+            tesseract_config: Tesseractに渡す追加オプション
+                （デフォルト: --psm 6、注文書のような均一なテキストブロックを想定）
         """
         if tesseract_path and os.path.exists(tesseract_path):
             pytesseract.pytesseract.tesseract_cmd = tesseract_path
         self.lang = lang
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.dpi = dpi
+        self.fast_dpi = fast_dpi
+        self.confidence_threshold = confidence_threshold
+        self.tesseract_config = tesseract_config
+    
+    def _preprocess(self, image: Image.Image) -> Image.Image:
+        """OCR前に画像をグレースケール化・二値化
+        
+        Tesseractに渡す画素データを1チャンネルに減らし、内部での色変換を省く
+        
+        Args:
+            image: 元の画像
+            
+        Returns:
+            二値化された画像
+        """
+        if image.mode == '1':
+            # FAX画像など、既に二値化されている場合はそのまま使う
+            return image
+        if image.mode not in _BINARIZE_MODES:
+            # 16bitグレースケールなどはconvert('L')で値が飽和して真っ白になるため、
+            # 前処理せずそのまま渡す
+            return image
+        
+        if image.mode == 'P' and 'transparency' in image.info:
+            image = image.convert('RGBA')
+        if 'A' in image.getbands():
+            # 透過部分は白背景に合成する（そのままグレースケール化すると透過部分が黒になる）
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        
+        gray = image.convert('L')
+        threshold = _otsu_threshold(gray.histogram())
+        return gray.point([255 if p > threshold else 0 for p in range(256)], mode='1')
+    
+    def _image_to_string(self, image: Image.Image) -> str:
+        """前処理した画像からテキストを抽出
+        
+        Args:
+            image: 画像
+            
+        Returns:
+            抽出されたテキスト
+        """
+        return pytesseract.image_to_string(
+            self._preprocess(image), lang=self.lang, config=self.tesseract_config
+        )
     
     def extract_text_from_image(self, image_path: str) -> str:
         """画像ファイルからテキストを抽出
@@ -36,8 +145,8 @@ class OCRProcessor:
             抽出されたテキスト
         """
         try:
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image, lang=self.lang)
+            with Image.open(image_path) as image:
+                text = self._image_to_string(image)
             logger.info(f"画像からテキスト抽出完了: {image_path}")
             return text
         except Exception as e:
@@ -54,16 +163,35 @@ class OCRProcessor:
             抽出されたテキスト（全ページ結合）
         """
         try:
-            # PDFを画像に変換
-            images = convert_from_path(pdf_path, dpi=300)
-            logger.info(f"PDFを{len(images)}ページの画像に変換: {pdf_path}")
-            
-            # 各ページからテキスト抽出
-            all_text = []
-            for i, image in enumerate(images):
-                text = pytesseract.image_to_string(image, lang=self.lang)
-                all_text.append(text)
-                logger.info(f"ページ {i+1}/{len(images)} 処理完了")
+            # PDFを一時フォルダに画像として書き出し、ページごとに読み込む
+            # （全ページの画像を同時にメモリへ保持しない）
+            with tempfile.TemporaryDirectory() as tmpdir:
+                dpi, first_page_text = self._probe_first_page(pdf_path, tmpdir)
+                
+                # 低解像度を採用した場合は、判定に使った1ページ目の結果をそのまま使い、
+                # 2ページ目以降だけを変換する
+                first_page = 1 if first_page_text is None else 2
+                image_paths = convert_from_path(
+                    pdf_path, dpi=dpi, first_page=first_page, output_folder=tmpdir,
+                    fmt='png', paths_only=True, thread_count=self.max_workers
+                )
+                page_count = len(image_paths) + first_page - 1
+                logger.info(f"PDFを{page_count}ページの画像に変換: {pdf_path}")
+                
+                # 各ページからテキスト抽出
+                # tesseractは別プロセスで実行されるため、スレッドでページを並列処理できる
+                # （結果はページ順を保持）
+                workers = max(1, min(self.max_workers, len(image_paths)))
+                if workers > 1:
+                    # 複数ページのtesseractを同時に動かす場合のみ内部スレッド数を制限する
+                    limit_tesseract_threads()
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    page_texts = list(executor.map(
+                        self._ocr_page, image_paths, range(first_page, page_count + 1),
+                        [page_count] * len(image_paths)
+                    ))
+                
+                all_text = page_texts if first_page_text is None else [first_page_text] + page_texts
             
             combined_text = "\n".join(all_text)
             logger.info(f"PDFからテキスト抽出完了: {pdf_path}")
@@ -72,6 +200,100 @@ class OCRProcessor:
             logger.error(f"PDF OCR処理エラー {pdf_path}: {e}")
             raise
     
+    def _probe_first_page(self, pdf_path: str, tmpdir: str) -> Tuple[int, Optional[str]]:
+        """PDFの変換解像度を決定
+        
+        1ページ目を低解像度でOCRし、平均信頼度が閾値以上なら低解像度を使う
+        （FAX原稿は約200dpiのため、多くの場合は低解像度で精度が落ちない）
+        
+        Args:
+            pdf_path: PDFファイルのパス
+            tmpdir: 画像を書き出す一時フォルダ
+            
+        Returns:
+            (変換に使う解像度, 低解像度を採用した場合は1ページ目のテキスト、それ以外はNone)
+        """
+        if self.fast_dpi >= self.dpi:
+            return self.dpi, None
+        
+        probe_paths = convert_from_path(
+            pdf_path, dpi=self.fast_dpi, first_page=1, last_page=1,
+            output_folder=tmpdir, fmt='png', paths_only=True
+        )
+        if not probe_paths:
+            return self.dpi, None
+        
+        with Image.open(probe_paths[0]) as image:
+            text, mean_confidence = self._ocr_with_confidence(image)
+        
+        if mean_confidence is None:
+            return self.dpi, None
+        
+        use_fast = mean_confidence >= self.confidence_threshold
+        dpi = self.fast_dpi if use_fast else self.dpi
+        logger.info(f"1ページ目の平均信頼度 {mean_confidence:.1f}: {dpi}dpiで変換します")
+        return dpi, (text if use_fast else None)
+    
+    def _ocr_with_confidence(self, image: Image.Image) -> Tuple[str, Optional[float]]:
+        """1回のtesseract実行でテキストと単語の平均信頼度を取得
+        
+        image_to_stringとimage_to_dataを別々に呼ぶと同じ画像を2回OCRするため、
+        テキスト（txt）と単語ごとの信頼度（tsv）を同時に出力させる
+        
+        Args:
+            image: 画像
+            
+        Returns:
+            (抽出されたテキスト, 単語の平均信頼度、単語がない場合はNone)
+        """
+        tesseract = pytesseract.pytesseract
+        with tesseract.save(self._preprocess(image)) as (temp_name, input_filename):
+            tesseract.run_tesseract(
+                input_filename=input_filename,
+                output_filename_base=temp_name,
+                extension='txt',
+                lang=self.lang,
+                config=f'{self.tesseract_config} -c tessedit_create_tsv=1',
+            )
+            with open(f'{temp_name}.txt', encoding='utf-8') as f:
+                text = f.read()
+            with open(f'{temp_name}.tsv', encoding='utf-8') as f:
+                tsv_lines = f.read().splitlines()
+        
+        # 単語として認識された箇所の信頼度のみを使う（-1は単語以外の領域）
+        confidences = []
+        if tsv_lines:
+            header = tsv_lines[0].split('\t')
+            conf_index = header.index('conf')
+            text_index = header.index('text')
+            for line in tsv_lines[1:]:
+                columns = line.split('\t')
+                if len(columns) <= text_index or not columns[text_index].strip():
+                    continue
+                conf = float(columns[conf_index])
+                if conf >= 0:
+                    confidences.append(conf)
+        
+        if not confidences:
+            return text, None
+        return text, sum(confidences) / len(confidences)
+    
+    def _ocr_page(self, image_path: str, page_no: int, page_count: int) -> str:
+        """PDFの1ページ分の画像からテキストを抽出
+        
+        Args:
+            image_path: ページ画像のパス
+            page_no: ページ番号（1始まり）
+            page_count: 総ページ数
+            
+        Returns:
+            抽出されたテキスト
+        """
+        with Image.open(image_path) as image:
+            text = self._image_to_string(image)
+        logger.info(f"ページ {page_no}/{page_count} 処理完了")
+        return text
+    
     def extract_text(self, file_path: str) -> str:
         """ファイル形式を自動判定してテキスト抽出
         
@@ -5,12 +5,10 @@ OCRテスト用スクリプト
 import os
 import sys
 from pathlib import Path
-from dotenv import load_dotenv
 
+from config import get_config
 from ocr_processor import OCRProcessor
 
-load_dotenv()
-
 
 def main():
     if len(sys.argv) < 2:
@@ -23,14 +21,14 @@ def main():
         print(f"ファイルが見つかりません: {file_path}")
         sys.exit(1)
     
-    tesseract_path = os.getenv('TESSERACT_PATH')
-    ocr_lang = os.getenv('OCR_LANG', 'jpn+eng')
+    config = get_config()
     
     print(f"ファイル: {file_path}")
     print(f"OCR処理中...")
     print("-" * 50)
     
-    ocr_processor = OCRProcessor(tesseract_path, ocr_lang)
+    ocr_processor = OCRProcessor(config.tesseract_path, config.ocr_lang,
+                                 tesseract_config=config.ocr_config)
     
     try:
         text = ocr_processor.extract_text(file_path)